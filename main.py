@@ -1,19 +1,36 @@
 # -*- coding: utf-8 -*-
 
-from typing import Any, List, Optional
+import re
+import sys
+import pickle
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, ClassVar, Dict, List, Optional
 from dataclasses import dataclass
+from threading import Lock, Thread
 
-import vlc
 import msvcrt
 import requests
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
+
+if TYPE_CHECKING:
+	import vlc
 
 
 URL = 'https://radiopotok.ru/rock'
+FILE_RE = re.compile(r'"file"\s*:\s*"([^"]+)"')
+CACHE_FILE = Path.home() / '.cache' / 'radioonline' / 'stations.pkl'
+TIMEOUT = 5
+
+SESSION = requests.Session()
+SESSION.headers.update({
+	'User-Agent': 'Mozilla/5.0 (compatible; RadioOnline)',
+	'Accept-Encoding': 'gzip'})
 
 
 @dataclass
 class Station:
+	__slots__ = ('id', 'title', 'stream_url')
+
 	id: int
 	title: str
 	stream_url: str
@@ -23,32 +40,82 @@ class Station:
 
 
 class _StationParser:
-	def get_station_list(self) -> List[Station]:
+	@classmethod
+	def get_station_list(cls) -> List[Station]:
 		''' Получить список станций '''
 
-		response = requests.get(URL)
+		cache = cls._load_cache()
+		headers: Dict[str, str] = {}
+		if cache.get('etag'):
+			headers['If-None-Match'] = cache['etag']
+		if cache.get('last_modified'):
+			headers['If-Modified-Since'] = cache['last_modified']
+
+		try:
+			response = SESSION.get(URL, headers=headers, timeout=TIMEOUT)
+		except requests.RequestException as error:
+			raise ValueError('Invalid connection!') from error
+
+		if response.status_code == 304 and 'stations' in cache:
+			return cache['stations']
 		if response.status_code != 200:
 			raise ValueError('Invalid connection!')
 
-		soup = BeautifulSoup(response.text, 'html.parser')
+		output = cls._parse(response.text)
+		cls._save_cache({
+			'etag': response.headers.get('ETag'),
+			'last_modified': response.headers.get('Last-Modified'),
+			'stations': output})
+
+		return output
+
+	@staticmethod
+	def _parse(html: str) -> List[Station]:
+		''' Разобрать страницу со списком станций '''
+
+		tree = LexborHTMLParser(html)
 
 		output: List[Station] = []
-		html_buttons = soup.find_all('button', attrs={'class': 'radio-card'})
 
-		for btn in html_buttons:
-			radio_id = int(btn['data-id'])
-			radio_title = btn['aria-label'].split(maxsplit=1)[1]
-			file_url = btn.find('script').text.strip().split('file')[1].split('"')[2].replace('\\', '')
+		for script in tree.css('button.radio-card > script'):
+			btn = script.parent
+			radio_id = int(btn.attributes['data-id'])
+			radio_title = btn.attributes['aria-label'].split(maxsplit=1)[1]
+			file_url = FILE_RE.search(script.text()).group(1).replace('\\', '')
 			output.append(Station(id=radio_id,
 			                      title=radio_title,
 			                      stream_url=file_url))
 
 		return output
 
+	@staticmethod
+	def _load_cache() -> Dict[str, Any]:
+		''' Прочитать сохранённый список станций и заголовки ответа '''
+
+		try:
+			with CACHE_FILE.open('rb') as file:
+				cache = pickle.load(file)
+		except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+			return {}
+
+		return cache if isinstance(cache, dict) else {}
+
+	@staticmethod
+	def _save_cache(cache: Dict[str, Any]) -> None:
+		''' Сохранить список станций для следующего запуска '''
+
+		try:
+			CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+			with CACHE_FILE.open('wb') as file:
+				pickle.dump(cache, file)
+		except OSError:
+			pass
+
 
 class Radio:
 	def __init__(self):
 		self._now_station: Station = None
+		self.player: Optional['vlc.MediaPlayer'] = None
 
 	@property
 	def now_station(self) -> Optional[Station]:
@@ -69,6 +136,9 @@ class Radio:
 	def play(self) -> None:
 		''' Начать проигрывание '''
 
+		# libVLC грузится долго, поэтому импортируем его только при первом проигрывании
+		import vlc
+
 		self.stop()
 		instance = vlc.Instance('--input-repeat=-1', '--fullscreen')
 		self.player = instance.media_player_new()
@@ -78,15 +148,15 @@ class Radio:
 		print(f'Сейчас играет "{self.now_station.title}"')
 
 	def stop(self) -> None:
-		if hasattr(self, 'player'):
+		if self.player is not None:
 			self.player.stop()
 
 	def pause(self) -> None:
-		if hasattr(self, 'player'):
+		if self.player is not None:
 			self.player.pause()
 
 	def volume(self, value: int) -> None:
-		if not hasattr(self, 'player'):
+		if self.player is None:
 			return
 
 		self.player.audio_set_volume(value)
@@ -99,15 +169,13 @@ class PathManager:
 
 	def forward(self, name: str) -> None:
 		self.memory.append(name)
-		finded_page = filter(lambda p: p.name==name, self.page_manager.pages)
-		self.page_manager.current_page = next(finded_page)
+		self.page_manager.current_page = self.page_manager.get_page(name)
 
 	def back(self) -> None:
 		if len(self.memory) > 1:
-			self.memory = self.memory[:-1]
+			self.memory.pop()
 
-		last_page = self.memory[-1]
-		self.memory = self.memory[:-1]
+		last_page = self.memory.pop()
 		self.forward(last_page)
 
 
@@ -129,40 +197,76 @@ class AskStation(AskPage):
 	''' Страница выбора станции '''
 
 	name = 'station'
+	_stations_cache: ClassVar[Optional[List[Station]]] = None
+	_stations_lock: ClassVar[Lock] = Lock()
 
 	def __init__(self, path_manager: PathManager):
 		super().__init__(self.name)
 		self.path_manager = path_manager
 
 		self.radio = Radio()
-		self._parser = _StationParser()
-		self.stations = self._parser.get_station_list()
+		self._menu_text: Optional[str] = None
+
+	@classmethod
+	def _load_stations(cls) -> List[Station]:
+		''' Загрузить список станций (один раз на все страницы) '''
+
+		with cls._stations_lock:
+			if cls._stations_cache is None:
+				cls._stations_cache = _StationParser.get_station_list()
+
+		return cls._stations_cache
+
+	@classmethod
+	def prefetch_stations(cls) -> None:
+		''' Начать загрузку списка станций в фоне '''
+
+		def load() -> None:
+			try:
+				cls._load_stations()
+			except Exception:
+				# Ошибку покажет повторная загрузка при открытии страницы
+				pass
+
+		Thread(target=load, daemon=True).start()
+
+	@property
+	def stations(self) -> List[Station]:
+		return self._load_stations()
+
+	def _format_stations(self) -> str:
+		''' Сформировать текст списка станций '''
+
+		lines = ['Select station:']
+		titles = [station.title for station in self.stations]
+		count = len(titles)
+		for i in range(0, count, 2):
+			line = f"{f'{i+1}.':<4} {titles[i]}"
+			if i+1 < count:
+				line = f"{line:<40}{f'{i+2}.':<4} {titles[i+1]}"
+			lines.append(line)
+
+		return '\n'.join(lines) + '\n\n'
 
 	def show_text(self) -> None:
 		''' Отобразить список станций '''
 
-		print('Select station:')
-		i = 0
-		while i <= len(self.stations):
-			num_1 = f'{i+1}.'.ljust(4)
-			station_1 = f'{num_1} {self.stations[i]}'.ljust(40)
-			try:
-				num_2 = f'{i+2}.'.ljust(4)
-				station_2 = f'{num_2} {self.stations[i+1]}'
-			except IndexError:
-				station_2 = ''
+		if self._menu_text is None:
+			self._menu_text = self._format_stations()
 
-			print(station_1 + station_2)
-			i += 2
-		print()
+		sys.stdout.write(self._menu_text)
 
-	def get_input(self) -> int:
+	def get_input(self) -> Station:
 		''' Запросить номер станции у пользователя '''
 
-		self.show_text()
-		station_number = int(input('Введи номер станции: '))-1
+		while True:
+			self.show_text()
 
-		return self.stations[station_number]
+			station_number = input('Введи номер станции: ').strip()
+			if station_number.isdecimal() and 0 < int(station_number) <= len(self.stations):
+				return self.stations[int(station_number)-1]
+
+			print('Нужно ввести номер станции из списка!')
 
 	def run_callback(self, station: Station) -> None:
 		''' Запустить радиостанцию '''
@@ -190,20 +294,19 @@ class AskMenu(AskPage):
 
 	def show_text(self) -> None:
 		text = 'МЕНЮ:\n1. Выбрать станцию\n2. Настройка громкости\n'
-		if hasattr(self.radio, 'player'):
+		if self.radio.player is not None:
 			text += ''
 		print(text + '\n0. Выход', end='\n'*2)
 
 	def get_input(self) -> int:
-		self.show_text()
+		while True:
+			self.show_text()
 
-		try:
-			selected_element = int(input('Введи номер строки: '))
-		except ValueError:
-			print('Нужно ввести цифру!')
-			selected_element = self.get_input()
+			selected_element = input('Введи номер строки: ').strip()
+			if selected_element.isdecimal():
+				return int(selected_element)
 
-		return selected_element
+			print('Нужно ввести цифру!')
 
 	def run_callback(self, index: int) -> None:
 		''' Запустить выбранный callback '''
@@ -216,6 +319,7 @@ class AskVolume(AskPage):
 	''' Страница настройки громкости '''
 
 	name = 'volume_settings'
+	_BARS = ['█' * n + ' ' * (20 - n) for n in range(21)]
 
 	def __init__(self, path_manager: PathManager, radio: Radio):
 		super().__init__(self.name)
@@ -224,68 +328,89 @@ class AskVolume(AskPage):
 		self.callbacks = [
 			lambda: self.path_manager.back(),
 		]
+		self._volume: Optional[int] = None
 
 	def show_text(self) -> None:
 		print('Для настройки используй кнопки ↑ и ↓.\nДля выхода нажми Enter.')
 
-	def get_volume_scale(self) -> str:
-		if not hasattr(self.radio, 'player'):
-			return 'сначала нужно выбрать станцию.'
+	def get_volume(self) -> int:
+		''' Текущая громкость (запрашивается у VLC, пока не станет известна) '''
 
-		player = self.radio.player
-		volume = player.audio_get_volume()
+		if self._volume is not None:
+			return self._volume
 
-		output = '| ' + ('█' * (volume // 5)).ljust(20)
-		output += ' | {}%'.format(str(volume).rjust(3))
-		return output
+		# Пока у VLC нет аудиовыхода, он возвращает -1: такое значение не запоминаем
+		volume = self.radio.player.audio_get_volume()
+		if volume >= 0:
+			self._volume = volume
 
-	def volume_up(self) -> None:
-		''' Увеличить громкость '''
+		return volume
 
-		if not hasattr(self.radio, 'player'):
-			return
+	def get_volume_scale(self) -> str:
+		if self.radio.player is None:
+			return 'сначала нужно выбрать станцию.'
 
-		player = self.radio.player
-		volume = player.audio_get_volume()
+		volume = self.get_volume()
+		bar = self._BARS[min(max(volume, 0), 100) // 5]
 
-		if volume >= 100:
-			return
+		return f'| {bar} | {volume:>3}%'
 
-		player.audio_set_volume(volume+1)
+	def volume_up(self) -> Optional[int]:
+		''' Увеличить громкость. Вернуть новое значение или None '''
 
-	def volume_down(self) -> None:
-		''' Снизить громкость '''
+		if self.radio.player is None:
+			return None
 
-		if not hasattr(self.radio, 'player'):
-			return
+		volume = self.get_volume()
+		if volume < 0 or volume >= 100:
+			return None
 
-		player = self.radio.player
-		volume = player.audio_get_volume()
+		self._volume = volume+1
+		self.radio.player.audio_set_volume(self._volume)
+		return self._volume
 
-		if volume <= 0:
-			return
+	def volume_down(self) -> Optional[int]:
+		''' Снизить громкость. Вернуть новое значение или None '''
+
+		if self.radio.player is None:
+			return None
+
+		volume = self.get_volume()
+		if volume <= 0:		# в том числе -1, пока громкость неизвестна
+			return None
 
-		player.audio_set_volume(volume-1)
+		self._volume = volume-1
+		self.radio.player.audio_set_volume(self._volume)
+		return self._volume
 
 	def get_input(self) -> None:
+		# Плеер мог смениться с прошлого захода, поэтому громкость перечитываем
+		self._volume = None
+
 		self.show_text()
 		print('\rГромкость {}'.format(self.get_volume_scale()), end='')
 		while True:
-			pressed_key = msvcrt.getch()
-			if ord(pressed_key) == 13:		# Enter
+			pressed_key = ord(msvcrt.getch())
+			if pressed_key == 13:		# Enter
 				print('\n')
 				self.path_manager.back()
 				return None
-			elif ord(pressed_key) == 72:	# ↑
-				self.volume_up()
-			elif ord(pressed_key) == 80:	# ↓
-				self.volume_down()
-			print('\rГромкость {}'.format(self.get_volume_scale()), end='')
+			elif pressed_key == 72:		# ↑
+				volume = self.volume_up()
+			elif pressed_key == 80:		# ↓
+				volume = self.volume_down()
+			else:
+				volume = None
+
+			# Перерисовываем шкалу только если громкость изменилась
+			if volume is not None:
+				print('\rГромкость {}'.format(self.get_volume_scale()), end='')
 
 
 class AskManager:
 	def __init__(self):
 		self.__asks: AskPage = []
+		self.__asks_by_name: Dict[str, AskPage] = {}
 		self.path_manager = PathManager(self)
 
 		station_page = AskStation(path_manager=self.path_manager)
@@ -314,8 +439,12 @@ class AskManager:
 	def pages(self) -> List[AskPage]:
 		return self.__asks
 
+	def get_page(self, name: str) -> AskPage:
+		return self.__asks_by_name[name]
+
 	def add_ask(self, new_ask: AskPage) -> None:
 		self.__asks.append(new_ask)
+		self.__asks_by_name[new_ask.name] = new_ask
 
 	def get_input(self) -> Any:
 		return self.current_page.get_input()
@@ -323,6 +452,7 @@ class AskManager:
 
 class Controller:
 	def __init__(self):
+		AskStation.prefetch_stations()
 		self.view = AskManager()
 
 	def mainloop(self) -> None: